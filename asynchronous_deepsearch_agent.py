@@ -1,312 +1,335 @@
 # Deep Research AI Agentic System
 # An implementation of a multi-agent research system using LangChain and LangGraph
 import asyncio
-from datetime import datetime
+import logging
 import os
 import re
+import orjson
 from urllib.parse import urlparse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Tuple
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Set, Tuple, TypedDict, AsyncIterator
+from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
 from langchain_tavily import TavilySearch
 from langgraph.graph import StateGraph, END
+from langgraph.config import get_stream_writer
+from async_lru import alru_cache
+from src.semantic_cache import SemanticCache, make_cache_key
+from src.research_utils import (
+    MAX_DRAFT_RETRIES, MAX_RESEARCH_RESULTS, MAX_FOLLOW_UP_QUESTIONS, MIN_RELEVANT_RESULTS,
+    MIN_KEYWORD_COVERAGE, current_date, normalize_query, ingest_results, topk, is_sufficient,
+    keyword_coverage,
+)
+from src.state import AgentState, AnalysisOutcome, DraftOutcome
+from src.redis_cache import TAVILY_TTL, shared_key, ashared_get, ashared_set
+from src.tavily_client import PooledTavilySearchAPIWrapper
+from src.logging_setup import setup_logging
 
 if "SSL_CERT_FILE" in os.environ:
     del os.environ["SSL_CERT_FILE"]
-# Load environment variables
-load_dotenv()
-OPENAI_API=os.getenv("OPENAI_API")
-TAVILY_API=os.getenv("TAVILY_API")
-# Configure API keys
-os.environ["OPENAI_API_KEY"] = OPENAI_API
-os.environ["TAVILY_API_KEY"] = TAVILY_API
-current_date = datetime.now().strftime("%Y-%m-%d")
-
-# Define the state schema for our agent system
-class AgentState(BaseModel):
-    """State for the research agent system."""
-    query: str
-    research_results: List[Dict[str, Any]] = []
-    follow_up_questions: List[str] = []
-    drafted_answer: str = ""
-    final_answer: str = ""
-    needs_more_research: bool = False
-    research_complete: bool = False
+# Load environment variables from .env only when the API keys are not already set
+if "OPENAI_API_KEY" not in os.environ or "TAVILY_API_KEY" not in os.environ:
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Configure API keys from the names used in .env
+    for name in ("OPENAI_API", "TAVILY_API"):
+        if name in os.environ:
+            os.environ.setdefault(f"{name}_KEY", os.environ[name])
+logger = logging.getLogger(__name__)
 
 # Initialize LLM models for our agents
-researcher_llm = ChatOpenAI(model="gpt-4-turbo", temperature=0)
+researcher_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 drafter_llm = ChatOpenAI(model="gpt-4-turbo", temperature=0.2)
 
+# Semantic caches for the drafting and analyzer chains
+embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+draft_cache = SemanticCache("draft", embeddings, schema=DraftOutcome)
+analyze_cache = SemanticCache("analyze", embeddings, ttl=3600, schema=AnalysisOutcome)
+
+# Prompt and chain for the drafting agent, built once at import
+drafter_system_prompt = """You are an expert at synthesizing research into clear, comprehensive answers.
+Complete the following three tasks in order and return the results of all of them.
+
+Task 1: Draft
+Use only the provided research results to answer the query.
+Do not use any external knowledge or make assumptions beyond the provided information.
+At the end of each paragraph or key point, include a citation in this format: [source](URL).
+If multiple results support a point, include up to 2 citations.
+Do not invent citations not present in the list below.
+If the research results don't contain enough information to fully answer the query, state that explicitly.
+
+Task 2: Self-evaluate
+Evaluate the quality and completeness of your draft.
+Determine if the draft adequately addresses the original query or if more research is needed.
+Only if essential aspects of the query remain unaddressed, set needs_more_research
+and list follow-up search questions that would gather the missing information.
+
+Task 3: Finalize
+Refine the draft into a polished, final answer. Make improvements to:
+1. Ensure all parts of the original query are addressed
+2. Improve clarity, structure, and flow
+3. Eliminate redundancy
+4. At the end of each key point, add a citation in format like [1], [2], etc., referring to the corresponding research source.
+5. Format the answer appropriately with headers, bullet points, etc. as needed
+6. Include a complete and properly formatted References section at the end with all cited sources
+
+IMPORTANT: Make sure all citations in the text have corresponding entries in the References section.
+Format the References section like this:
+
+References:
+1. [Title 1](URL1)
+2. [Title 2](URL2)
+Ensure every citation in the text has a corresponding entry in the References list.
+Do not remove any citations from the body."""
+drafter_prompt = ChatPromptTemplate.from_messages([
+    ("system", drafter_system_prompt),
+    # The long research corpus goes before the short query so the prompt
+    # prefix can be served from the provider's prompt cache
+    ("user", "Research Corpus:\n{formatted_research_results_text}"),
+    ("user", "Today's date is {current_date}.\nOriginal Query: {query}"),
+])
+drafter_chain = (
+    drafter_prompt 
+    | drafter_llm.with_structured_output(DraftOutcome, method="function_calling")
+)
+
 # Initialize the Tavily search tool
-search_tool = TavilySearch(k=8,search_depth='advanced')
+# Async searches go through a shared, pooled HTTP/2 client
+search_tool = TavilySearch(k=8,search_depth='advanced', api_wrapper=PooledTavilySearchAPIWrapper())
+
+# Memoized results expire with the shared cache's
+@alru_cache(maxsize=256, ttl=TAVILY_TTL)
+async def cached_search(query: str) -> Any:
+    """Search Tavily, memoized on the normalized query."""
+    # Check the cache shared with other worker processes, if configured
+    key = shared_key("tavily", query)
+    results = await ashared_get(key)
+    if not isinstance(results, dict):
+        results = await search_tool.ainvoke(query)
+        # Only a dict without an "error" key holds results; anything else is a failed or empty search
+        if isinstance(results, dict) and "error" not in results:
+            await ashared_set(key, results, TAVILY_TTL)
+    return results
+
+async def search_tavily(query: str) -> Any:
+    """Search Tavily through the cache, without caching failed searches."""
+    query = normalize_query(query)
+    results = await cached_search(query)
+    if not isinstance(results, dict) or "error" in results:
+        cached_search.cache_invalidate(query)
+    return results
+
+# Background searches, referenced until done so they are not garbage collected
+prefetch_tasks: Set[asyncio.Task] = set()
+
+def prefetch_search(query: str) -> None:
+    """Start a search in the background; a later search_tavily call for the same query awaits it from the cache."""
+    task = asyncio.create_task(search_tavily(query))
+    prefetch_tasks.add(task)
+    task.add_done_callback(prefetch_tasks.discard)
+
+# Prompt and chain for the research analyzer, built once at import
+research_analyzer_system_prompt = """You are a research analyst who evaluates search results.
+        Analyze the search results and determine if they adequately address the query.
+        If not, generate follow-up questions that would help gather more relevant information."""
+research_analyzer_prompt = ChatPromptTemplate.from_messages([
+    ("system", research_analyzer_system_prompt),
+    # The system message is static and the per-call content follows it, so the
+    # prompt prefix can be served from the provider's prompt cache
+    ("user", "Research Results:{research_results}"),
+    ("user", "Today's date is {current_date}.\nOriginal Query: {query}"),
+    MessagesPlaceholder(variable_name="history"),
+])
+research_analyzer_chain = (
+    research_analyzer_prompt 
+    | researcher_llm.with_structured_output(AnalysisOutcome, method="function_calling")
+)
 
 # Research Agent Implementation
 async def search_web(state: AgentState) -> AgentState:
     """Search the web for information related to the query."""
-    print("🔍 Research Agent: Searching the web...")
+    logger.info("🔍 Research Agent: Searching the web...")
     
     # Use Tavily to search for information
-    search_results = await search_tool.ainvoke(state.query)
-    formatted_results = []
-    
-    # Clean up and filter results
-    for r in search_results:
-        if isinstance(r, dict):
-            # Clean up content
-            if "content" in r:
-                # Remove obvious repeats and truncate very long content
-                content = r["content"]
-                if len(content) > 2000:
-                    # Take only first 2000 chars to avoid repetition
-                    content = content[:2000]
-                r["content"] = content
-            formatted_results.append(r)
-    # Update the state with search results
-    state.research_results.extend(formatted_results)
+    search_results = await search_tavily(state["query"])
+    # Clean up and filter results, skipping URLs and content already collected
+    ingest_results(state, search_results)
     return state
 
 async def analyze_research_needs(state: AgentState) -> AgentState:
     """Analyze the research results and determine if more research is needed."""
-    print("🔍 Research Agent: Analyzing research needs...")
+    logger.info("🔍 Research Agent: Analyzing research needs...")
     
-
-    research_analyzer_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.You are a research analyst who evaluates search results.
-        Analyze the search results and determine if they adequately address the query.
-        If not, generate follow-up questions that would help gather more relevant information."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Research Results:{research_results}"),
-        MessagesPlaceholder(variable_name="history"),
-    ])
+    research_results = state.get("research_results", [])
+    # More sources add little once enough have been collected
+    if len(research_results) >= MAX_RESEARCH_RESULTS:
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
+    
+    # Skip the analyzer when enough results mention the query's keywords, which needs no model call
+    if (len(research_results) >= MIN_RELEVANT_RESULTS
+            and keyword_coverage(state["query"], research_results) >= MIN_KEYWORD_COVERAGE):
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
+    
+    # Skip the analyzer LLM call when the results are clearly relevant already
+    if is_sufficient(research_results):
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
     
-    chain = (
-        research_analyzer_prompt 
-        | researcher_llm 
-        | StrOutputParser()
+    # Only the best results go to the analyzer, so its prompt stays bounded across rounds
+    top_results = topk(research_results)
+    # Key on the model, the prompt, the exact results and the query
+    cache_key = make_cache_key(
+        f"{researcher_llm.model_name}\n{research_analyzer_system_prompt}",
+        state["query"],
+        top_results
     )
     
-    result = await chain.ainvoke({
-        "query": state.query,
-        "research_results":state.research_results ,
+    analyzer_inputs = {
+        "query": state["query"],
+        "current_date": current_date(),
+        # Serialize up front rather than letting the template repr() the dicts
+        "research_results": orjson.dumps(top_results, option=orjson.OPT_SORT_KEYS).decode(),
         "history": []
-    })
-    
-    # Parse the result to determine if more research is needed
-    if "FOLLOW-UP QUESTIONS:" in result:
-        state.needs_more_research = True
-        # Extract follow-up questions
-        questions_part = result.split("FOLLOW-UP QUESTIONS:")[1]
-        # Parse numbered or bullet-point questions
-        questions = [q.strip() for q in questions_part.split("\n") if q.strip() and any(c.isdigit() for c in q[:2])]
-        if not questions:  # Try another parsing approach if the above didn't work
-            questions = [q.strip().strip('•-') for q in questions_part.split("\n") if q.strip() and (q.strip().startswith('•') or q.strip().startswith('-'))]
-        if not questions:  # If still no structured questions, take whole section
-            questions = [questions_part.strip()]
-        
-        state.follow_up_questions.extend(questions)
+    }
+    
+    async def stream_outcome() -> AnalysisOutcome:
+        # Start searching each follow-up question as soon as the analyzer has
+        # finished writing it, overlapping the searches with the rest of the output
+        prefetched = 0
+        outcome = None
+        async for outcome in research_analyzer_chain.astream(analyzer_inputs):
+            if outcome is None or not outcome.needs_more_research:
+                continue
+            # The last question in a partial outcome may still be incomplete
+            complete = min(len(outcome.follow_up_questions) - 1, MAX_FOLLOW_UP_QUESTIONS)
+            for question in outcome.follow_up_questions[prefetched:complete]:
+                prefetch_search(question)
+            prefetched = max(prefetched, complete)
+        if outcome is None:
+            # The stream produced no parsable output; ask again without streaming
+            outcome = await research_analyzer_chain.ainvoke(analyzer_inputs)
+        return outcome
+    
+    outcome = await analyze_cache.aask(cache_key, stream_outcome)
+    
+    # The analyzer returns its decision and follow-up questions as structured output
+    if outcome.needs_more_research and outcome.follow_up_questions:
+        state["needs_more_research"] = True
+        # The planned questions are all searched in parallel, so bound the fan-out
+        state.setdefault("follow_up_questions", []).extend(outcome.follow_up_questions[:MAX_FOLLOW_UP_QUESTIONS])
     else:
-        state.research_complete = True
+        state["research_complete"] = True
     
     return state
 
 async def conduct_follow_up_research(state: AgentState) -> AgentState:
     """Conduct additional research based on follow-up questions."""
-    print("🔍 Research Agent: Conducting follow-up research...")
+    logger.info("🔍 Research Agent: Conducting follow-up research...")
     
-    if not state.follow_up_questions:
-        state.research_complete = True
+    if not state.get("follow_up_questions"):
+        state["research_complete"] = True
         return state
     
-    # Take the next follow-up question
-    follow_up_query = state.follow_up_questions.pop(0)
-    
-    # Use Tavily to search for additional information
-    additional_results = await search_tool.ainvoke(follow_up_query)
+    # Search all pending follow-up questions concurrently
+    follow_up_queries = state["follow_up_questions"]
+    results_lists = await asyncio.gather(*[search_tavily(q) for q in follow_up_queries])
     
-    # Clean up and filter results
-    formatted_results = []
-    for r in additional_results:
-        if isinstance(r, dict):
-            # Add context about which question these results address
-            r["follow_up_query"] = follow_up_query
-            
-            # Clean up content
-            if "content" in r:
-                # Remove obvious repeats and truncate very long content
-                content = r["content"]
-                if len(content) > 2000:
-                    # Take only first 2000 chars to avoid repetition
-                    content = content[:2000]
-                r["content"] = content
-            formatted_results.append(r)
-
-    # Update the state with new search results
-    state.research_results.extend(formatted_results)
+    # Clean up and filter results, skipping URLs and content already collected
+    for follow_up_query, additional_results in zip(follow_up_queries, results_lists):
+        ingest_results(state, additional_results, follow_up_query)
     
-    # If there are no more follow-up questions, mark research as complete
-    if not state.follow_up_questions:
-        state.research_complete = True
-        state.needs_more_research = False
+    # All follow-up questions have been answered, so research is complete
+    state["follow_up_questions"] = []
+    state["research_complete"] = True
+    state["needs_more_research"] = False
     
     return state
 
 # Drafting Agent Implementation
 async def draft_answer(state: AgentState) -> AgentState:
-    """Draft an answer based on the research results."""
-    print("✍️ Drafting Agent: Creating initial draft...")
-     # Deduplicate research results based on content
-    seen_content = set()
-    filtered_results = []
-    for result in state.research_results:
-        content = result.get("content", "")
-        content_hash = hash(content[:100])  # Use first 100 chars as a signature
-        if content_hash not in seen_content and content.strip():
-            seen_content.add(content_hash)
-            filtered_results.append(result)
-  
-    # Format research results with citations (including actual URLs)
-    formatted_research_results = []
-    for i, result in enumerate(filtered_results):
-        content = result.get("content", "")
-        url = result.get("url", "")
-        citation = f"[{i+1}]({url})"
-        formatted_research_results.append(f"{content} {citation}")
-    
-    formatted_research_results_text = "\n".join(formatted_research_results)
-    drafter_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.
-You are an expert at synthesizing research into clear, comprehensive answers.
-Use only the provided research results to answer the query.
-Do not use any external knowledge or make assumptions beyond the provided information.
-At the end of each paragraph or key point, include a citation in this format: [source](URL).
-If multiple results support a point, include up to 2 citations.
-Do not invent citations not present in the list below.
-If the research results don't contain enough information to fully answer the query, state that explicitly."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Research Results:{formatted_research_results_text}"),
-    ])
-    
-    chain = (
-        drafter_prompt 
-        | drafter_llm 
-        | StrOutputParser()
+    """Draft, self-evaluate and finalize an answer based on the research results."""
+    logger.info("✍️ Drafting Agent: Drafting and finalizing answer...")
+    # Results were deduplicated by URL and content when they were collected
+    filtered_results = [
+        result for result in state.get("research_results", [])
+        if result.get("content", "").strip()
+    ]
+    # Sort by URL so the formatted corpus, and with it the prompt prefix, is stable
+    filtered_results.sort(key=lambda result: result.get("url", ""))
+    # Format research results with citations (including actual URLs) in a single pass
+    formatted_research_results_text = "\n".join(
+        f"{result.get('content', '')} [{i+1}]({result['url']})" if result.get("url")
+        else f"{result.get('content', '')} [{i+1}]"
+        for i, result in enumerate(filtered_results)
     )
-    
-    drafted_answer = await chain.ainvoke({
-        "query": state.query,
+    # Key on the model too, so drafts from a previous model are not served from Redis
+    cache_key = make_cache_key(f"{drafter_llm.model_name}\n{drafter_system_prompt}", state["query"], filtered_results)
+    # Bound the draft -> research -> draft cycle
+    state["retry_count"] = state.get("retry_count", 0) + 1
+    can_retry = (state["retry_count"] < MAX_DRAFT_RETRIES
+                 and len(state.get("research_results", [])) < MAX_RESEARCH_RESULTS)
+    writer = get_stream_writer()
+    streamed = 0
+    # Streamed text is held back until its line is complete, so the citations
+    # in each line can be checked against the collected results before sending
+    valid_normed = valid_citation_urls(state)
+    pending = ""
+    
+    def send(text: str, last: bool = False) -> None:
+        nonlocal pending
+        pending += text
+        cut = len(pending) if last else pending.rfind("\n") + 1
+        if cut:
+            writer({"final_answer": remove_invalid_citations(pending[:cut], valid_normed)})
+            pending = pending[cut:]
+    
+    drafter_inputs = {
+        "query": state["query"],
+        "current_date": current_date(),
         "formatted_research_results_text": formatted_research_results_text
-    })
-    
-    state.drafted_answer = drafted_answer
-    return state
-
-async def evaluate_draft(state: AgentState) -> AgentState:
-    """Evaluate the draft to determine if more research is needed."""
-    print("✍️ Drafting Agent: Evaluating draft quality...")
-    
-
-    evaluator_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.You evaluate the quality and completeness of an answer draft.
-        Determine if the draft adequately addresses the original query or if more research is needed.
-        If certain aspects of the query remain unaddressed or if the information seems insufficient,
-        indicate what additional information would be helpful."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Drafted Answer: {drafted_answer}"),
-        ("user", "Research Results:{research_results}"),
-    ])
-    
-    chain = (
-        evaluator_prompt 
-        | researcher_llm 
-        | StrOutputParser()
-    )
-    
-    evaluation = await chain.ainvoke({
-        "query": state.query,
-        "drafted_answer": state.drafted_answer,
-        "research_results": state.research_results
-    })
-    
-    # Determine if more research is needed based on the evaluation
-    if "ADDITIONAL RESEARCH NEEDED:" in evaluation:
-        state.needs_more_research = True
-        
-        # Extract follow-up questions
-        questions_part = evaluation.split("ADDITIONAL RESEARCH NEEDED:")[1]
-        questions = [q.strip() for q in questions_part.split("\n") if q.strip() and not q.strip().startswith("•")]
-        
-        state.follow_up_questions.extend(questions)
+    }
+    
+    async def stream_outcome() -> DraftOutcome:
+        # Stream the final answer to the caller as the drafter writes it. The
+        # parser yields nothing until the draft and self-evaluation fields are
+        # complete, so the first chunk arrives only after the whole draft has
+        # been generated, and a final answer that will be discarded for more
+        # research is never streamed.
+        nonlocal streamed
+        outcome = None
+        async for outcome in drafter_chain.astream(drafter_inputs):
+            if outcome is None or (outcome.needs_more_research and outcome.follow_ups and can_retry):
+                continue
+            if len(outcome.final) > streamed:
+                send(outcome.final[streamed:])
+                streamed = len(outcome.final)
+        if outcome is None:
+            # The stream produced no parsable output; ask again without streaming
+            outcome = await drafter_chain.ainvoke(drafter_inputs)
+        return outcome
+    
+    outcome = await draft_cache.aask(cache_key, stream_outcome)
+    
+    if outcome.needs_more_research and outcome.follow_ups and can_retry:
+        state["needs_more_research"] = True
+        state["follow_up_questions"] = outcome.follow_ups[:MAX_FOLLOW_UP_QUESTIONS]
     else:
-        state.needs_more_research = False
+        state["needs_more_research"] = False
+        # Send whatever was not streamed, e.g. the whole answer on a cache hit
+        send(outcome.final[streamed:], last=True)
     
+    state["drafted_answer"] = outcome.draft
+    state["final_answer"] = outcome.final
     return state
 
-async def finalize_answer(state: AgentState) -> AgentState:
-    """Finalize the answer by refining the draft."""
-    print("✍️ Drafting Agent: Finalizing answer...")
-    unique_results = {}
-    for result in state.research_results:
-        url = result.get("url", "")
-        if url and url not in unique_results:
-            unique_results[url] = result
-    
-    # If no URLs were found, use the whole list
-    if not unique_results:
-        unique_results = {i: result for i, result in enumerate(state.research_results)}
-    # Format the unique results
-    formatted_research_results = []
-    for i, (_, result) in enumerate(unique_results.items()):
-        content = result.get("content", "")
-        url = result.get("url", "")
-        citation = f"[{i+1}]({url})"
-        formatted_research_results.append(f"{content} {citation}")
-    
-    formatted_research_results_text = "\n".join(formatted_research_results)
-
-    finalizer_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a skilled editor who refines draft content into polished, final answers.
-        Review the drafted answer and make improvements to:
-        1. Ensure all parts of the original query are addressed
-        2. Improve clarity, structure, and flow
-        3. Eliminate redundancy
-        4. At the end of each key point, add a citation in format like [1], [2], etc., referring to the corresponding research source.
-        5. Format the answer appropriately with headers, bullet points, etc. as needed
-        6. Include a complete and properly formatted References section at the end with all cited sources
-        
-        IMPORTANT: Make sure all citations in the text have corresponding entries in the References section.
-        Format the References section like this:
-        
-        References:
-        1. [Title 1](URL1)
-        2. [Title 2](URL2)
-        Ensure every citation in the text has a corresponding entry in the References list.
-        Do not remove any citations from the body.
-        """),
-        ("user", "Original Query: {query}"),
-        ("user", "Draft Answer: {drafted_answer}"),
-        ("user", "Research Results:{formatted_research_results_text}"),
-    ])
-    
-    chain = (
-        finalizer_prompt 
-        | drafter_llm 
-        | StrOutputParser()
-    )
-    
-    final_answer = await chain.ainvoke({
-        "query": state.query,
-        "drafted_answer": state.drafted_answer,
-        "formatted_research_results_text": formatted_research_results_text
-    })
-    
-    state.final_answer = final_answer
-    return state
 def extract_urls_from_draft(draft_answer: str) -> List[str]:
-    url_pattern = r'https?://[^\s\)\]\.,"\']+'  # stop at common closing chars
+    url_pattern = r'https?://[^\s\)\]"\'<>]+'  # stop at common closing chars
     candidates = re.findall(url_pattern, draft_answer)
     # as a fallback, clean each up:
     return [url.rstrip(').,;"\']') for url in candidates]
@@ -316,13 +339,23 @@ def normalize(url: str) -> str:
     path = p.path.rstrip('/')
     return f"{hostname}{path}"
 
-def validate_citations(state: AgentState) -> AgentState:
-    valid_normed = {normalize(r["url"]) for r in state.research_results}
-    cleaned = state.drafted_answer
-    for url in extract_urls_from_draft(state.drafted_answer):
+def valid_citation_urls(state: AgentState) -> Set[str]:
+    """Normalized URLs of the collected research results."""
+    return {normalize(r["url"]) for r in state.get("research_results", [])}
+
+def remove_invalid_citations(text: str, valid_normed: Set[str]) -> str:
+    """Replace URLs that are not among the research results."""
+    cleaned = text
+    for url in extract_urls_from_draft(text):
         if normalize(url) not in valid_normed:
             cleaned = cleaned.replace(url, "[Invalid citation removed]")
-    state.drafted_answer = cleaned
+    return cleaned
+
+def validate_citations(state: AgentState) -> AgentState:
+    valid_normed = valid_citation_urls(state)
+    # The final answer is written in the same call as the draft, so check both
+    for key in ("drafted_answer", "final_answer"):
+        state[key] = remove_invalid_citations(state.get(key, ""), valid_normed)
     return state
 # Orchestration with LangGraph
 def create_research_graph() -> StateGraph:
@@ -335,53 +368,58 @@ def create_research_graph() -> StateGraph:
     workflow.add_node("conduct_follow_up_research", conduct_follow_up_research)
     workflow.add_node("draft_answer", draft_answer)
     workflow.add_node("validate_citations", validate_citations)
-    workflow.add_node("evaluate_draft", evaluate_draft)
-    workflow.add_node("finalize_answer", finalize_answer)
     
     # Define the flow
     workflow.add_edge("search_web", "analyze_research_needs")
     workflow.add_conditional_edges(
         "analyze_research_needs",
-        lambda state: "conduct_follow_up_research" if state.needs_more_research else "draft_answer"
-    )
-    workflow.add_conditional_edges(
-        "conduct_follow_up_research",
-        lambda state: "analyze_research_needs" if not state.research_complete else "draft_answer"
+        lambda state: "conduct_follow_up_research" if state.get("needs_more_research") else "draft_answer"
     )
+    workflow.add_edge("conduct_follow_up_research", "draft_answer")
     workflow.add_edge("draft_answer", "validate_citations")
-    workflow.add_edge("validate_citations", "evaluate_draft")
 
+    # The drafter's self-evaluation decides whether more research is needed
     workflow.add_conditional_edges(
-        "evaluate_draft",
-        lambda state: "conduct_follow_up_research" if state.needs_more_research else "finalize_answer"
+        "validate_citations",
+        lambda state: "conduct_follow_up_research" if state.get("needs_more_research") else END
     )
-    workflow.add_edge("finalize_answer", END)
     
     # Set entry point
     workflow.set_entry_point("search_web")
     
     return workflow
 
+# Compile the graph into a runnable once and reuse it for every query
+research_app = create_research_graph().compile()
+
 # Main Application
 async def research_agent_system(query: str) -> str:
     """Main function to execute the research agent system."""
-    print(f"🚀 Starting research on: {query}")
-    
-    # Create the workflow graph
-    graph = create_research_graph()
-    
-    # Compile the graph into a runnable
-    app = graph.compile()
+    logger.info("🚀 Starting research on: %s", query)
     
     # Run the workflow
     initial_state = AgentState(query=query)
-    result = await app.ainvoke(initial_state)
+    result = await research_app.ainvoke(initial_state)
     
-    print("\n✅ Research complete!")
+    logger.info("\n✅ Research complete!")
     return result['final_answer']
 
+async def stream_research_agent_system(query: str) -> AsyncIterator[str]:
+    """Stream the final answer line by line as it is written, with invalid citations removed.
+
+    The first line arrives once the drafter has finished its draft and self-evaluation.
+    """
+    logger.info("🚀 Starting research on: %s", query)
+    
+    initial_state = AgentState(query=query)
+    async for chunk in research_app.astream(initial_state, stream_mode="custom"):
+        yield chunk["final_answer"]
+    
+    logger.info("\n✅ Research complete!")
+
 # usage
 if __name__ == "__main__":
+    setup_logging()
     user_query = "What are the latest advancements in quantum computing and their potential impact on cryptography?"
     answer = asyncio.run(research_agent_system(user_query))
     print("\n📝 FINAL ANSWER:")
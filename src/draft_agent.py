@@ -1,148 +1,47 @@
 import os
-from datetime import datetime
-from pydantic import BaseModel
-from typing import List, Dict, Any, Tuple
-from dotenv import load_dotenv
+import logging
+from typing import List, Dict, Any, Set, Tuple, TypedDict
+from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
-# Load environment variables
-load_dotenv()
-OPENAI_API=os.getenv("OPENAI_API")
-TAVILY_API=os.getenv("TAVILY_API")
-# Configure API keys
-os.environ["OPENAI_API_KEY"] = OPENAI_API
-current_date = datetime.now().strftime("%Y-%m-%d")
-# Define the state schema for our agent system
-class AgentState(BaseModel):
-    """State for the research agent system."""
-    query: str
-    research_results: List[Dict[str, Any]] = []
-    follow_up_questions: List[str] = []
-    drafted_answer: str = ""
-    final_answer: str = ""
-    needs_more_research: bool = False
-    research_complete: bool = False
-
+from src.semantic_cache import SemanticCache, make_cache_key
+from src.state import AgentState, DraftOutcome
+from src.research_utils import MAX_DRAFT_RETRIES, MAX_RESEARCH_RESULTS, MAX_FOLLOW_UP_QUESTIONS, current_date
+# Load environment variables from .env only when the API keys are not already set
+if "OPENAI_API_KEY" not in os.environ:
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Configure the API key from the name used in .env
+    if "OPENAI_API" in os.environ:
+        os.environ["OPENAI_API_KEY"] = os.environ["OPENAI_API"]
+logger = logging.getLogger(__name__)
 # Initialize LLM models for the agents
-researcher_llm = ChatOpenAI(model="gpt-4-turbo", temperature=0)   
 drafter_llm = ChatOpenAI(model="gpt-4-turbo", temperature=0.2)
 
-    # Drafting Agent Implementation
-def draft_answer(state: AgentState) -> AgentState:
-    """Draft an answer based on the research results."""
-    print("✍️ Drafting Agent: Creating initial draft...")
-     # Deduplicate research results based on content
-    seen_content = set()
-    filtered_results = []
-    for result in state.research_results:
-        content = result.get("content", "")
-        content_hash = hash(content[:100])  # Use first 100 chars as a signature
-        if content_hash not in seen_content and content.strip():
-            seen_content.add(content_hash)
-            filtered_results.append(result)
-  
-    # Format research results with citations (including actual URLs)
-    formatted_research_results = []
-    for i, result in enumerate(filtered_results):
-        content = result.get("content", "")
-        url = result.get("url", "")
-        citation = f"[{i+1}]({url})"
-        formatted_research_results.append(f"{content} {citation}")
-    
-    formatted_research_results_text = "\n".join(formatted_research_results)
-    drafter_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.You are an expert at synthesizing research into clear, comprehensive answers.
+# Semantic cache for the drafting chain
+embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+draft_cache = SemanticCache("draft", embeddings, schema=DraftOutcome)
+
+# Prompt and chain for the drafting agent, built once at import
+drafter_system_prompt = """You are an expert at synthesizing research into clear, comprehensive answers.
+        Complete the following three tasks in order and return the results of all of them.
+
+        Task 1: Draft
         Based on the provided research results, create a well-structured and informative response that directly addresses the original query.
         At the end of each paragraph or key point, include a citation in this format: [source](URL).
         If multiple results support a point, include up to 2 citations.
         Do not invent citations not present in the list below.
-        If the research results don't contain enough information to fully answer the query, note this in your response."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Research Results:{formatted_research_results_text}"),
-    ])
-    
-    chain = (
-        drafter_prompt 
-        | drafter_llm 
-        | StrOutputParser()
-    )
-    
-    drafted_answer = chain.invoke({
-        "query": state.query,
-        "formatted_research_results_text": formatted_research_results_text
-    })
-    
-    state.drafted_answer = drafted_answer
-    return state
-
-def evaluate_draft(state: AgentState) -> AgentState:
-    """Evaluate the draft to determine if more research is needed."""
-    print("✍️ Drafting Agent: Evaluating draft quality...")
-    
+        If the research results don't contain enough information to fully answer the query, note this in your response.
 
-    evaluator_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.You evaluate the quality and completeness of an answer draft.
+        Task 2: Self-evaluate
+        Evaluate the quality and completeness of your draft.
         Determine if the draft adequately addresses the original query or if more research is needed.
-        If certain aspects of the query remain unaddressed or if the information seems insufficient,
-        indicate what additional information would be helpful."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Drafted Answer: {drafted_answer}"),
-        ("user", "Research Results:{research_results}"),
-    ])
-    
-    chain = (
-        evaluator_prompt 
-        | researcher_llm 
-        | StrOutputParser()
-    )
-    
-    evaluation = chain.invoke({
-        "query": state.query,
-        "drafted_answer": state.drafted_answer,
-        "research_results": state.research_results
-    })
-    
-    # Determine if more research is needed based on the evaluation
-    if "ADDITIONAL RESEARCH NEEDED:" in evaluation:
-        state.needs_more_research = True
-        
-        # Extract follow-up questions
-        questions_part = evaluation.split("ADDITIONAL RESEARCH NEEDED:")[1]
-        questions = [q.strip() for q in questions_part.split("\n") if q.strip() and not q.strip().startswith("•")]
-        
-        state.follow_up_questions.extend(questions)
-    else:
-        state.needs_more_research = False
-    
-    return state
-
-def finalize_answer(state: AgentState) -> AgentState:
-    """Finalize the answer by refining the draft."""
-    print("✍️ Drafting Agent: Finalizing answer...")
-    unique_results = {}
-    for result in state.research_results:
-        url = result.get("url", "")
-        if url and url not in unique_results:
-            unique_results[url] = result
-    
-    # If no URLs were found, use the whole list
-    if not unique_results:
-        unique_results = {i: result for i, result in enumerate(state.research_results)}
-    # Format the unique results
-    formatted_research_results = []
-    for i, (_, result) in enumerate(unique_results.items()):
-        content = result.get("content", "")
-        url = result.get("url", "")
-        citation = f"[{i+1}]({url})"
-        formatted_research_results.append(f"{content} {citation}")
-    
-    formatted_research_results_text = "\n".join(formatted_research_results)
+        Only if essential aspects of the query remain unaddressed, set needs_more_research
+        and list follow-up search questions that would gather the missing information.
 
-    finalizer_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a skilled editor who refines draft content into polished, final answers.
-        Review the drafted answer and make improvements to:
+        Task 3: Finalize
+        Refine the draft into a polished, final answer. Make improvements to:
         1. Ensure all parts of the original query are addressed
         2. Improve clarity, structure, and flow
         3. Eliminate redundancy
@@ -157,24 +56,54 @@ def finalize_answer(state: AgentState) -> AgentState:
         1. [Title 1](URL1)
         2. [Title 2](URL2)
         Ensure every citation in the text has a corresponding entry in the References list.
-        Do not remove any citations from the body.
-        """),
-        ("user", "Original Query: {query}"),
-        ("user", "Draft Answer: {drafted_answer}"),
-        ("user", "Research Results:{formatted_research_results_text}"),
-    ])
-    
-    chain = (
-        finalizer_prompt 
-        | drafter_llm 
-        | StrOutputParser()
+        Do not remove any citations from the body."""
+drafter_prompt = ChatPromptTemplate.from_messages([
+    ("system", drafter_system_prompt),
+    # The long research corpus goes before the short query so the prompt
+    # prefix can be served from the provider's prompt cache
+    ("user", "Research Corpus:\n{formatted_research_results_text}"),
+    ("user", "Today's date is {current_date}.\nOriginal Query: {query}"),
+])
+drafter_chain = (
+    drafter_prompt 
+    | drafter_llm.with_structured_output(DraftOutcome, method="function_calling")
+)
+
+    # Drafting Agent Implementation
+def draft_answer(state: AgentState) -> AgentState:
+    """Draft, self-evaluate and finalize an answer based on the research results."""
+    logger.info("✍️ Drafting Agent: Drafting and finalizing answer...")
+    # Results were deduplicated by URL and content when they were collected
+    filtered_results = [
+        result for result in state.get("research_results", [])
+        if result.get("content", "").strip()
+    ]
+    # Sort by URL so the formatted corpus, and with it the prompt prefix, is stable
+    filtered_results.sort(key=lambda result: result.get("url", ""))
+    # Format research results with citations (including actual URLs) in a single pass
+    formatted_research_results_text = "\n".join(
+        f"{result.get('content', '')} [{i+1}]({result['url']})" if result.get("url")
+        else f"{result.get('content', '')} [{i+1}]"
+        for i, result in enumerate(filtered_results)
     )
-    
-    final_answer = chain.invoke({
-        "query": state.query,
-        "drafted_answer": state.drafted_answer,
+    # Key on the model too, so drafts from a previous model are not served from Redis
+    cache_key = make_cache_key(f"{drafter_llm.model_name}\n{drafter_system_prompt}", state["query"], filtered_results)
+    outcome = draft_cache.ask(cache_key, lambda: drafter_chain.invoke({
+        "query": state["query"],
+        "current_date": current_date(),
         "formatted_research_results_text": formatted_research_results_text
-    })
+    }))
+    
+    # Bound the draft -> research -> draft cycle
+    state["retry_count"] = state.get("retry_count", 0) + 1
+    can_retry = (state["retry_count"] < MAX_DRAFT_RETRIES
+                 and len(state.get("research_results", [])) < MAX_RESEARCH_RESULTS)
+    if outcome.needs_more_research and outcome.follow_ups and can_retry:
+        state["needs_more_research"] = True
+        state["follow_up_questions"] = outcome.follow_ups[:MAX_FOLLOW_UP_QUESTIONS]
+    else:
+        state["needs_more_research"] = False
     
-    state.final_answer = final_answer
-    return state
\ No newline at end of file
+    state["drafted_answer"] = outcome.draft
+    state["final_answer"] = outcome.final
+    return state
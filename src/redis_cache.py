@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional
+import orjson
+import redis
+import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+# Lifetimes of shared entries: web searches for a day, LLM outputs for an hour
+TAVILY_TTL = 24 * 3600
+LLM_TTL = 3600
+
+# Failures that leave the shared cache unavailable
+_REDIS_ERRORS = (redis.RedisError, OSError)
+# Seconds to wait for Redis, so an unreachable server costs a cache miss rather than a stalled run
+REDIS_TIMEOUT = 0.5
+
+# Async clients by event loop, since their connections are bound to the loop that opened them
+_async_clients: Dict[asyncio.AbstractEventLoop, Any] = {}
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> Any:
+    """Client for REDIS_URL, created on first use; None when the shared cache is not configured."""
+    url = os.getenv("REDIS_URL")
+    if not url:
+        return None
+    return redis.Redis.from_url(url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+
+
+def get_async_redis() -> Any:
+    """Async client for REDIS_URL on the running event loop; None when the shared cache is not configured."""
+    url = os.getenv("REDIS_URL")
+    if not url:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Drop the clients of loops that have finished; their connections cannot be reused
+        for stale in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[stale]
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT
+        )
+    return client
+
+
+def shared_key(prefix: str, text: str) -> str:
+    """Redis key for a value computed from the given text."""
+    return f"{prefix}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+def shared_get(key: str) -> Optional[Any]:
+    """Return the value stored under the key, or None on a miss or when Redis is off or unreachable."""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        raw = client.get(key)
+    except _REDIS_ERRORS as e:
+        logger.warning("Shared cache read failed: %s", e)
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+
+def shared_set(key: str, value: Any, ttl: int) -> None:
+    """Store a JSON-serializable value under the key for ttl seconds, if Redis is configured."""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.setex(key, ttl, orjson.dumps(value))
+    except _REDIS_ERRORS as e:
+        logger.warning("Shared cache write failed: %s", e)
+
+
+async def ashared_get(key: str) -> Optional[Any]:
+    """Async version of shared_get."""
+    client = get_async_redis()
+    if client is None:
+        return None
+    try:
+        raw = await client.get(key)
+    except _REDIS_ERRORS as e:
+        logger.warning("Shared cache read failed: %s", e)
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+
+async def ashared_set(key: str, value: Any, ttl: int) -> None:
+    """Async version of shared_set."""
+    client = get_async_redis()
+    if client is None:
+        return
+    try:
+        await client.setex(key, ttl, orjson.dumps(value))
+    except _REDIS_ERRORS as e:
+        logger.warning("Shared cache write failed: %s", e)
@@ -1,145 +1,169 @@
 import os
-from datetime import datetime
-from pydantic import BaseModel
-from typing import List, Dict, Any, Tuple
-from dotenv import load_dotenv
+import logging
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from typing import List, Dict, Any, Set, Tuple, TypedDict
+from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
 from langchain_tavily import TavilySearch
+from src.semantic_cache import SemanticCache, make_cache_key
+from src.research_utils import (
+    MAX_RESEARCH_RESULTS, MAX_FOLLOW_UP_QUESTIONS, MIN_RELEVANT_RESULTS, MIN_KEYWORD_COVERAGE,
+    current_date, normalize_query, ingest_results, topk, is_sufficient, keyword_coverage,
+)
+from src.state import AgentState, AnalysisOutcome
+from src.redis_cache import TAVILY_TTL, shared_key, shared_get, shared_set
 
-# Load environment variables
-load_dotenv()
-OPENAI_API=os.getenv("OPENAI_API")
-TAVILY_API=os.getenv("TAVILY_API")
-# Configure API keys
-os.environ["OPENAI_API_KEY"] = OPENAI_API
-os.environ["TAVILY_API_KEY"] = TAVILY_API
-
-current_date = datetime.now().strftime("%Y-%m-%d")
-# Define the state schema for our agent system
-class AgentState(BaseModel):
-    """State for the research agent system."""
-    query: str
-    research_results: List[Dict[str, Any]] = []
-    follow_up_questions: List[str] = []
-    drafted_answer: str = ""
-    final_answer: str = ""
-    needs_more_research: bool = False
-    research_complete: bool = False
+# Load environment variables from .env only when the API keys are not already set
+if "OPENAI_API_KEY" not in os.environ or "TAVILY_API_KEY" not in os.environ:
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Configure API keys from the names used in .env
+    for name in ("OPENAI_API", "TAVILY_API"):
+        if name in os.environ:
+            os.environ.setdefault(f"{name}_KEY", os.environ[name])
 
+logger = logging.getLogger(__name__)
 # Initialize LLM models for the agents
-researcher_llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+researcher_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 # Initialize the Tavily search tool
 search_tool = TavilySearch(k=8)
+# Shared thread pool for the blocking Tavily calls, created once at import
+search_executor = ThreadPoolExecutor(max_workers=16)
+
+class SearchError(Exception):
+    """Raised inside the search cache so that failed searches are not memoized."""
+
+@lru_cache(maxsize=512)
+def cached_search(query: str, ttl_bucket: int) -> Any:
+    """Search Tavily, memoized on the normalized query; hit/miss counts are in cached_search.cache_info().
+
+    ttl_bucket changes every TAVILY_TTL seconds, so memoized results expire like the shared cache's.
+    """
+    # Check the cache shared with other worker processes, if configured
+    key = shared_key("tavily", query)
+    results = shared_get(key)
+    if not isinstance(results, dict):
+        results = search_tool.invoke(query)
+        # Only a dict without an "error" key holds results; anything else is a failed or empty search
+        if not isinstance(results, dict) or "error" in results:
+            raise SearchError(results)
+        shared_set(key, results, TAVILY_TTL)
+    return results
+
+def search_tavily(query: str) -> Any:
+    """Search Tavily through the cache, without caching failed searches."""
+    try:
+        return cached_search(normalize_query(query), int(time.time() // TAVILY_TTL))
+    except SearchError as e:
+        return e.args[0]
+
+# Embedding model for the analyzer's semantic cache
+embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# Cache of analyzer outcomes, so repeated or rephrased queries skip the LLM call
+analyze_cache = SemanticCache("analyze", embeddings, ttl=3600, schema=AnalysisOutcome)
+
+# Prompt and chain for the research analyzer, built once at import
+research_analyzer_system_prompt = """You are a research analyst who evaluates search results.
+        Analyze the search results and determine if they adequately address the query.
+        If not, generate follow-up questions that would help gather more relevant information."""
+research_analyzer_prompt = ChatPromptTemplate.from_messages([
+    ("system", research_analyzer_system_prompt),
+    # The system message is static and the per-call content follows it, so the
+    # prompt prefix can be served from the provider's prompt cache
+    ("user", "Research Results:{research_results}"),
+    ("user", "Today's date is {current_date}.\nOriginal Query: {query}"),
+    MessagesPlaceholder(variable_name="history"),
+])
+research_analyzer_chain = (
+    research_analyzer_prompt 
+    | researcher_llm.with_structured_output(AnalysisOutcome, method="function_calling")
+)
 
 # Research Agent Implementation
 def search_web(state: AgentState) -> AgentState:
     """Search the web for information related to the query."""
-    print("🔍 Research Agent: Searching the web...")
+    logger.info("🔍 Research Agent: Searching the web...")
     
     # Use Tavily to search for information
-    search_results = search_tool.invoke(state.query)
-    formatted_results = []
-    
-    # Clean up and filter results
-    for r in search_results:
-        if isinstance(r, dict):
-            # Clean up content
-            if "content" in r:
-                # Remove obvious repeats and truncate very long content
-                content = r["content"]
-                if len(content) > 2000:
-                    # Take only first 2000 chars to avoid repetition
-                    content = content[:2000]
-                r["content"] = content
-            formatted_results.append(r)
-    # Update the state with search results
-    state.research_results.extend(formatted_results)
+    search_results = search_tavily(state["query"])
+    # Clean up and filter results, skipping URLs and content already collected
+    ingest_results(state, search_results)
     return state
 
 def analyze_research_needs(state: AgentState) -> AgentState:
     """Analyze the research results and determine if more research is needed."""
-    print("🔍 Research Agent: Analyzing research needs...")
+    logger.info("🔍 Research Agent: Analyzing research needs...")
     
-
-    research_analyzer_prompt = ChatPromptTemplate.from_messages([
-        ("system", f"""Today's date is {current_date}.You are a research analyst who evaluates search results.
-        Analyze the search results and determine if they adequately address the query.
-        If not, generate follow-up questions that would help gather more relevant information."""),
-        ("user", "Original Query: {query}"),
-        ("user", "Research Results:{research_results}"),
-        MessagesPlaceholder(variable_name="history"),
-    ])
+    research_results = state.get("research_results", [])
+    # More sources add little once enough have been collected
+    if len(research_results) >= MAX_RESEARCH_RESULTS:
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
     
-    chain = (
-        research_analyzer_prompt 
-        | researcher_llm 
-        | StrOutputParser()
-    )
+    # Skip the analyzer when enough results mention the query's keywords, which needs no model call
+    if (len(research_results) >= MIN_RELEVANT_RESULTS
+            and keyword_coverage(state["query"], research_results) >= MIN_KEYWORD_COVERAGE):
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
+    
+    # Skip the analyzer LLM call when the results are clearly relevant already
+    if is_sufficient(research_results):
+        state["needs_more_research"] = False
+        state["research_complete"] = True
+        return state
     
-    result = chain.invoke({
-        "query": state.query,
-        "research_results":state.research_results ,
+    # Only the best results go to the analyzer, so its prompt stays bounded across rounds
+    top_results = topk(research_results)
+    # Key on the model, the prompt, the exact results and the query
+    cache_key = make_cache_key(
+        f"{researcher_llm.model_name}\n{research_analyzer_system_prompt}",
+        state["query"],
+        top_results
+    )
+    outcome = analyze_cache.ask(cache_key, lambda: research_analyzer_chain.invoke({
+        "query": state["query"],
+        "current_date": current_date(),
+        # Serialize up front rather than letting the template repr() the dicts
+        "research_results": orjson.dumps(top_results, option=orjson.OPT_SORT_KEYS).decode(),
         "history": []
-    })
+    }))
     
-    # Parse the result to determine if more research is needed
-    if "FOLLOW-UP QUESTIONS:" in result:
-        state.needs_more_research = True
-        # Extract follow-up questions
-        questions_part = result.split("FOLLOW-UP QUESTIONS:")[1]
-        # Parse numbered or bullet-point questions
-        questions = [q.strip() for q in questions_part.split("\n") if q.strip() and any(c.isdigit() for c in q[:2])]
-        if not questions:  # Try another parsing approach if the above didn't work
-            questions = [q.strip().strip('•-') for q in questions_part.split("\n") if q.strip() and (q.strip().startswith('•') or q.strip().startswith('-'))]
-        if not questions:  # If still no structured questions, take whole section
-            questions = [questions_part.strip()]
-        
-        state.follow_up_questions.extend(questions)
+    # The analyzer returns its decision and follow-up questions as structured output
+    if outcome.needs_more_research and outcome.follow_up_questions:
+        state["needs_more_research"] = True
+        # The planned questions are all searched in parallel, so bound the fan-out
+        state.setdefault("follow_up_questions", []).extend(outcome.follow_up_questions[:MAX_FOLLOW_UP_QUESTIONS])
     else:
-        state.research_complete = True
+        state["research_complete"] = True
     
     return state
 
 def conduct_follow_up_research(state: AgentState) -> AgentState:
     """Conduct additional research based on follow-up questions."""
-    print("🔍 Research Agent: Conducting follow-up research...")
+    logger.info("🔍 Research Agent: Conducting follow-up research...")
     
-    if not state.follow_up_questions:
-        state.research_complete = True
+    if not state.get("follow_up_questions"):
+        state["research_complete"] = True
         return state
     
-    # Take the next follow-up question
-    follow_up_query = state.follow_up_questions.pop(0)
+    # Search all pending follow-up questions concurrently
+    follow_up_queries = state["follow_up_questions"]
+    results_lists = list(search_executor.map(search_tavily, follow_up_queries))
     
-    # Use Tavily to search for additional information
-    additional_results = search_tool.invoke(follow_up_query)
+    # Clean up and filter results, skipping URLs and content already collected
+    for follow_up_query, additional_results in zip(follow_up_queries, results_lists):
+        ingest_results(state, additional_results, follow_up_query)
     
-    # Clean up and filter results
-    formatted_results = []
-    for r in additional_results:
-        if isinstance(r, dict):
-            # Add context about which question these results address
-            r["follow_up_query"] = follow_up_query
-            
-            # Clean up content
-            if "content" in r:
-                # Remove obvious repeats and truncate very long content
-                content = r["content"]
-                if len(content) > 2000:
-                    # Take only first 2000 chars to avoid repetition
-                    content = content[:2000]
-                r["content"] = content
-            formatted_results.append(r)
-
-    # Update the state with new search results
-    state.research_results.extend(formatted_results)
+    # All follow-up questions have been answered, so research is complete
+    state["follow_up_questions"] = []
+    state["research_complete"] = True
+    state["needs_more_research"] = False
     
-    # If there are no more follow-up questions, mark research as complete
-    if not state.follow_up_questions:
-        state.research_complete = True
-        state.needs_more_research = False
-    
-    return state
\ No newline at end of file
+    return state
@@ -0,0 +1,130 @@
+import re
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+import xxhash
+
+# Bounds on the research loop: drafts that may ask for more research, and
+# the number of results after which more sources are not worth the tokens
+MAX_DRAFT_RETRIES = 2
+MAX_RESEARCH_RESULTS = 12
+# Follow-up searches planned per analysis, all issued in parallel
+MAX_FOLLOW_UP_QUESTIONS = 3
+# Longest content kept per search result
+MAX_CONTENT_CHARS = 1500
+
+# Research is sufficient once this many results have at least this Tavily relevance score
+MIN_RELEVANT_RESULTS = 5
+RELEVANCE_THRESHOLD = 0.8
+
+# Words left out when checking whether the results cover the query's keywords
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how in is it its of on or that the their
+there these this to was what when where which who why will with about into than them they
+""".split())
+MIN_KEYWORD_COVERAGE = 0.7
+
+# Control characters other than tab and newline, removed in a single translate pass
+_CONTROL_CHARS = dict.fromkeys([*range(0, 9), 11, 12, *range(14, 32), 127])
+# Runs of whitespace, and a sentence repeated back to back, collapsed in C by the regex engine
+_WHITESPACE = re.compile(r"\s+")
+_REPEATED_SENTENCE = re.compile(r"([^.]{10,200}\.)(?:\s+\1)+")
+
+
+def current_date() -> str:
+    """Today's date for the prompts, read on every call so long-running processes stay current."""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query for use as a cache key."""
+    return _WHITESPACE.sub(" ", query.strip().lower())
+
+
+def search_hits(search_results: Any) -> List[Any]:
+    """Hits of a Tavily response; none when the search failed or found nothing.
+
+    Tavily returns the hits under "results", an "error" key when the search
+    failed, and a message string when it found nothing.
+    """
+    if not isinstance(search_results, dict):
+        return []
+    return search_results.get("results", [])
+
+
+def clean_content(content: str) -> str:
+    """Strip control characters, drop repeated sentences and cap the content length."""
+    content = _WHITESPACE.sub(" ", _REPEATED_SENTENCE.sub(r"\1", content.translate(_CONTROL_CHARS)))
+    seen_shingles, sentences, length = set(), [], 0
+    for sentence in content.split(". "):
+        words = sentence.lower().split()
+        if not words:
+            continue
+        # A sentence is a repeat when all of its 5-word shingles were seen before
+        shingles = {tuple(words[i:i + 5]) for i in range(max(len(words) - 4, 1))}
+        if shingles <= seen_shingles:
+            continue
+        seen_shingles |= shingles
+        sentences.append(sentence)
+        length += len(sentence) + 2
+        if length >= MAX_CONTENT_CHARS:
+            break
+    return ". ".join(sentences)[:MAX_CONTENT_CHARS]
+
+
+def topk(results: List[Dict[str, Any]], k: int = 8, max_chars: int = 500) -> List[Dict[str, Any]]:
+    """Keep the k highest-scoring results, with only their title, URL and trimmed content."""
+    ranked = sorted(results, key=lambda r: r.get("score", 0), reverse=True)[:k]
+    return [
+        {"title": r.get("title", ""), "url": r.get("url", ""), "content": r.get("content", "")[:max_chars]}
+        for r in ranked
+    ]
+
+
+def is_sufficient(research_results: List[Dict[str, Any]]) -> bool:
+    """Check whether enough results are relevant, using Tavily's relevance scores instead of a model call."""
+    relevant = sum(r.get("score", 0) >= RELEVANCE_THRESHOLD for r in research_results)
+    return relevant >= MIN_RELEVANT_RESULTS
+
+
+def keyword_coverage(query: str, research_results: List[Dict[str, Any]]) -> float:
+    """Fraction of the query's keywords that appear in the content of at least one result."""
+    keywords = {word.strip("?.,!:;\"'()").lower() for word in query.split()} - STOPWORDS - {""}
+    if not keywords:
+        return 0.0
+    text = " ".join(r.get("content", "") for r in research_results).lower()
+    return sum(keyword in text for keyword in keywords) / len(keywords)
+
+
+def ingest_results(state: Dict[str, Any], search_results: Any,
+                   follow_up_query: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Clean the hits of a Tavily response and add them to the state's research results.
+
+    Hits whose URL or content was already collected are skipped; the added results are returned.
+    """
+    seen_urls = state.setdefault("seen_urls", set())
+    seen_content = state.setdefault("seen_content", set())
+    new_results = []
+    for r in search_hits(search_results):
+        if not isinstance(r, dict):
+            continue
+        # Copy so the cached search results are never modified
+        r = dict(r)
+        url = r.get("url")
+        if url in seen_urls:
+            continue
+        if follow_up_query is not None:
+            # Add context about which question these results address
+            r["follow_up_query"] = follow_up_query
+        # Clean up content: remove repeated sentences and truncate very long content
+        if "content" in r:
+            r["content"] = clean_content(r["content"])
+        # Skip identical content already collected from a different URL
+        r["content_sig"] = xxhash.xxh3_64_intdigest(r.get("content", "").encode("utf-8"))
+        if r["content_sig"] in seen_content:
+            continue
+        seen_content.add(r["content_sig"])
+        if url:
+            seen_urls.add(url)
+        new_results.append(r)
+    state.setdefault("research_results", []).extend(new_results)
+    return new_results
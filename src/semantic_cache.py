@@ -0,0 +1,165 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Callable, Awaitable, Optional, Type
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel
+from src.redis_cache import LLM_TTL, shared_key, shared_get, shared_set, ashared_get, ashared_set
+
+# Cache keys are (prompt and results hash, query text) pairs: the first part
+# must match exactly, only the query text is matched on its embedding
+CacheKey = Tuple[str, str]
+
+
+def make_cache_key(system_prompt: str, query: str, research_results: List[Dict[str, Any]]) -> CacheKey:
+    """Build a cache key from the system prompt, the exact set of results and the query."""
+    digest = hashlib.sha256(system_prompt.encode("utf-8"))
+    # Hash each result's URL and content, sorted, so any added or changed source misses the cache
+    signatures = sorted(
+        hashlib.sha256(f"{r.get('url', '')}\n{r.get('content', '')}".encode("utf-8")).hexdigest()
+        for r in research_results
+    )
+    for signature in signatures:
+        digest.update(signature.encode("ascii"))
+    return digest.hexdigest(), " ".join(query.lower().split())
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticCache:
+    """LRU cache for LLM chain outputs, matched on the embedding of the query for the same prompt and results.
+
+    When a pydantic schema is given, exact matches are also shared across
+    processes through Redis (if REDIS_URL is set).
+    """
+
+    def __init__(self, namespace: str, embeddings: Embeddings, threshold: float = 0.92,
+                 maxsize: int = 1024, ttl: Optional[float] = 3600,
+                 schema: Optional[Type[BaseModel]] = None):
+        self.namespace = namespace
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.schema = schema
+        # exact key -> (prompt and results hash, query, query embedding or None until
+        # needed, value, expiry), least recently used first
+        self._entries: "OrderedDict[str, Tuple[str, str, Optional[List[float]], Any, float]]" = OrderedDict()
+
+    def _exact_key(self, key: CacheKey) -> str:
+        payload_hash = hashlib.sha256(key[1].encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{key[0]}:{payload_hash}"
+
+    def _get(self, exact_key: str) -> Tuple[bool, Any]:
+        """Return the live entry stored under the exact key, refreshing its LRU position."""
+        entry = self._entries.get(exact_key)
+        if entry is None:
+            return False, None
+        if entry[4] < time.monotonic():
+            del self._entries[exact_key]
+            return False, None
+        self._entries.move_to_end(exact_key)
+        return True, entry[3]
+
+    def _candidates(self, key: CacheKey) -> List[str]:
+        """Exact keys of the live entries for the same prompt and results, the only ones a query can match."""
+        now = time.monotonic()
+        return [
+            exact_key for exact_key, (prompt_hash, _, _, _, expires_at) in self._entries.items()
+            if prompt_hash == key[0] and expires_at >= now
+        ]
+
+    def _texts_to_embed(self, key: CacheKey, candidates: List[str]) -> List[str]:
+        """The query, followed by the cached queries of candidates that were not embedded yet."""
+        return [key[1], *(self._entries[k][1] for k in candidates if self._entries[k][2] is None)]
+
+    def _search(self, candidates: List[str], vectors: List[List[float]]) -> Tuple[bool, Any, List[float]]:
+        """Return the candidate whose query is most similar to the first vector, if above the threshold.
+
+        The remaining vectors belong to the candidates that had no embedding yet, in order.
+        """
+        vector, *missing = [_normalize(v) for v in vectors]
+        best_score, best_key = -1.0, None
+        for exact_key in candidates:
+            prompt_hash, query, cached_vector, value, expires_at = self._entries[exact_key]
+            if cached_vector is None:
+                cached_vector = missing.pop(0)
+                self._entries[exact_key] = (prompt_hash, query, cached_vector, value, expires_at)
+            score = sum(a * b for a, b in zip(vector, cached_vector))
+            if score > best_score:
+                best_score, best_key = score, exact_key
+        if best_key is None or best_score < self.threshold:
+            return False, None, vector
+        hit, value = self._get(best_key)
+        return hit, value, vector
+
+    def _store(self, key: CacheKey, vector: Optional[List[float]], value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else math.inf
+        exact_key = self._exact_key(key)
+        self._entries[exact_key] = (key[0], key[1], vector, value, expires_at)
+        self._entries.move_to_end(exact_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _shared_ttl(self) -> int:
+        return int(self.ttl) if self.ttl is not None else LLM_TTL
+
+    def ask(self, key: CacheKey, compute: Callable[[], Any]) -> Any:
+        """Return a cached value for the key, or compute and cache it."""
+        exact_key = self._exact_key(key)
+        hit, value = self._get(exact_key)
+        if hit:
+            return value
+        if self.schema is not None:
+            shared = shared_get(shared_key("llm", exact_key))
+            if shared is not None:
+                return self.schema.model_validate(shared)
+        # Embed only when an entry for the same prompt and results could match,
+        # in one call for the query and any cached queries not embedded yet
+        vector = None
+        candidates = self._candidates(key)
+        if candidates:
+            vectors = self.embeddings.embed_documents(self._texts_to_embed(key, candidates))
+            hit, value, vector = self._search(candidates, vectors)
+            if hit:
+                return value
+        value = compute()
+        # Never cache a missing value, or every later lookup would return it
+        if value is None:
+            return value
+        self._store(key, vector, value)
+        if self.schema is not None:
+            shared_set(shared_key("llm", exact_key), value.model_dump(mode="json"), self._shared_ttl())
+        return value
+
+    async def aask(self, key: CacheKey, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of ask."""
+        exact_key = self._exact_key(key)
+        hit, value = self._get(exact_key)
+        if hit:
+            return value
+        if self.schema is not None:
+            shared = await ashared_get(shared_key("llm", exact_key))
+            if shared is not None:
+                return self.schema.model_validate(shared)
+        # Embed only when an entry for the same prompt and results could match,
+        # in one call for the query and any cached queries not embedded yet
+        vector = None
+        candidates = self._candidates(key)
+        if candidates:
+            vectors = await self.embeddings.aembed_documents(self._texts_to_embed(key, candidates))
+            hit, value, vector = self._search(candidates, vectors)
+            if hit:
+                return value
+        value = await compute()
+        # Never cache a missing value, or every later lookup would return it
+        if value is None:
+            return value
+        self._store(key, vector, value)
+        if self.schema is not None:
+            await ashared_set(shared_key("llm", exact_key), value.model_dump(mode="json"), self._shared_ttl())
+        return value
@@ -0,0 +1,45 @@
+from typing import List, Set, TypedDict
+from pydantic import BaseModel, Field
+from src.research_utils import MAX_FOLLOW_UP_QUESTIONS
+
+
+# Define the schema of a single search result
+class ResearchItem(TypedDict, total=False):
+    """A search result collected by the research agent."""
+    url: str
+    title: str
+    content: str
+    follow_up_query: str
+    score: float
+    content_sig: int
+
+
+# Define the state schema for our agent system
+class AgentState(TypedDict, total=False):
+    """State for the research agent system."""
+    query: str
+    research_results: List[ResearchItem]
+    follow_up_questions: List[str]
+    drafted_answer: str
+    final_answer: str
+    needs_more_research: bool
+    research_complete: bool
+    seen_urls: Set[str]
+    seen_content: Set[int]
+    retry_count: int
+
+
+# Structured output of the research analyzer
+class AnalysisOutcome(BaseModel):
+    """Whether the research answers the query, and what to search for if not."""
+    needs_more_research: bool = Field(description="Whether the search results fail to adequately address the query")
+    follow_up_questions: List[str] = Field(description=f"Up to {MAX_FOLLOW_UP_QUESTIONS} follow-up search questions that would gather more relevant information")
+
+
+# Structured output of the combined draft, self-evaluation and finalization call
+class DraftOutcome(BaseModel):
+    """Draft, self-evaluation and final answer produced in a single LLM call."""
+    draft: str = Field(description="Initial answer drafted from the research results")
+    needs_more_research: bool = Field(description="Whether more research is needed to answer the query")
+    follow_ups: List[str] = Field(description=f"Up to {MAX_FOLLOW_UP_QUESTIONS} follow-up search questions for the missing information")
+    final: str = Field(description="Polished final answer with citations and a References section")
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Tuple
+import httpx
+# Private module of langchain_tavily: this wrapper mirrors raw_results_async from
+# the version pinned in requirements.txt (0.2.x); re-check it when upgrading
+from langchain_tavily._utilities import TAVILY_API_URL, TavilySearchAPIWrapper
+
+# HTTP/2 clients by event loop, so concurrent searches reuse pooled keep-alive
+# connections while each asyncio.run gets connections bound to its own loop.
+# Each client is paired with the async generator that closes it.
+_clients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, AsyncIterator[None]]] = {}
+
+
+async def _close_on_shutdown(client: httpx.AsyncClient) -> AsyncIterator[None]:
+    """Hold the client open until the loop finalizes its async generators, as asyncio.run does on exit."""
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def get_tavily_client() -> httpx.AsyncClient:
+    """Pooled client for the running event loop, created on first use."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        # Forget loops that have finished; their clients were closed on shutdown
+        for stale in [l for l in _clients if l.is_closed()]:
+            del _clients[stale]
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+        closer = _close_on_shutdown(client)
+        await closer.__anext__()
+        entry = _clients[loop] = (client, closer)
+    return entry[0]
+
+
+class PooledTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+    """Tavily search API wrapper that sends async requests through a pooled client."""
+
+    async def raw_results_async(self, query: str, **kwargs: Any) -> Dict[str, Any]:
+        """Get results from the Tavily Search API over a pooled connection."""
+        # Remove None values
+        params = {k: v for k, v in {"query": query, **kwargs}.items() if v is not None}
+        headers = {
+            "Authorization": f"Bearer {self.tavily_api_key.get_secret_value()}",
+            "Content-Type": "application/json",
+            "X-Client-Source": "langchain-tavily",
+        }
+        base_url = self.api_base_url or TAVILY_API_URL
+        client = await get_tavily_client()
+        response = await client.post(f"{base_url}/search", json=params, headers=headers)
+        response.raise_for_status()
+        return response.json()